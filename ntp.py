@@ -6,7 +6,7 @@
 Features
 --------
 * 通过 UDP 实现纯 Python 的 NTP 客户端（不依赖第三方库）。
-* 自动回退至备用 NTP 服务器列表。
+* 并发查询备用 NTP 服务器列表，采用最先到达的有效响应。
 * 支持在 Windows 与 Linux 上 **同步系统时间**（需要管理员/ROOT 权限）。
 * `--set-system` 参数控制是否写入系统时间。
 * `--debug` 打开调试日志。
@@ -19,17 +19,20 @@ License : MIT
 
 import argparse
 import ctypes
+import errno
+import functools
 import logging
 import os
 import platform
+import random
+import selectors
 import socket
 import struct
-import subprocess
 import sys
 import time
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import List, Optional, Protocol
+from typing import Any, Dict, List, Optional, Protocol, Tuple
 
 # --------------------------------------------------------------
 # 常量 & 数据类
@@ -44,6 +47,15 @@ DEFAULT_SERVERS = [
 ]
 DEFAULT_TIMEOUT = 5.0          # 秒
 SYNC_THRESHOLD = 1.0          # 秒，差值大于该阈值才尝试同步系统时间
+DNS_CACHE_TTL = 300.0         # 秒，服务器地址解析结果的缓存时间
+BAD_SERVER_COOLDOWN = 300.0   # 秒，返回无效响应的服务器在此期间内不再使用
+BACKOFF_BASE = 5.0            # 秒，首次重试前的等待时间（之后每次翻倍）
+BACKOFF_CAP = 600.0           # 秒，重试等待时间上限
+
+_TS_UNPACK = struct.Struct("!II").unpack_from   # 秒 + 小数部分（32.32 定点数）
+_FRAC_SCALE = 1.0 / 4294967296.0                # 1 / 2**32
+_RX_BUF_SIZE = 512                              # 接收缓冲区大小（字节）
+_PLATFORM = platform.system().lower()           # "windows" / "linux" / "darwin" ...
 
 
 @dataclass
@@ -53,11 +65,25 @@ class NTPConfig:
     timeout: float = DEFAULT_TIMEOUT
     version: int = 4                     # NTP 协议版本，4 为当前推荐
     sync_threshold: float = SYNC_THRESHOLD
+    retries: int = 0                     # 全部服务器失败后的重试次数
+    backoff_base: float = BACKOFF_BASE
+    backoff_cap: float = BACKOFF_CAP
+
+    def __post_init__(self) -> None:
+        if self.retries < 0:
+            raise ValueError("retries 不能为负数: %d" % self.retries)
+        if self.backoff_base < 0:
+            raise ValueError("backoff_base 不能为负数: %r" % self.backoff_base)
+        if self.backoff_cap < 0:
+            raise ValueError("backoff_cap 不能为负数: %r" % self.backoff_cap)
 
 
 # --------------------------------------------------------------
 # 日志初始化
 # --------------------------------------------------------------
+log = logging.getLogger(__name__)
+
+
 def init_logging(debug: bool = False) -> None:
     level = logging.DEBUG if debug else logging.INFO
     logging.basicConfig(
@@ -67,6 +93,14 @@ def init_logging(debug: bool = False) -> None:
     )
 
 
+# --------------------------------------------------------------
+# 本地时间显示
+# --------------------------------------------------------------
+def _format_local(unix_ts: float) -> str:
+    """将 Unix 时间戳格式化为本地时区的 ``YYYY-MM-DD HH:MM:SS TZ``。"""
+    return time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime(unix_ts))
+
+
 # --------------------------------------------------------------
 # 抽象时间写入接口（跨平台统一入口）
 # --------------------------------------------------------------
@@ -79,134 +113,248 @@ class TimeSetter(Protocol):
 # --------------------------------------------------------------
 # Windows 实现（使用 WinAPI SetSystemTime）
 # --------------------------------------------------------------
+class SYSTEMTIME(ctypes.Structure):
+    """WinAPI SYSTEMTIME 结构体"""
+    _fields_ = [
+        ("wYear", ctypes.c_ushort),
+        ("wMonth", ctypes.c_ushort),
+        ("wDayOfWeek", ctypes.c_ushort),   # 0 = Sunday
+        ("wDay", ctypes.c_ushort),
+        ("wHour", ctypes.c_ushort),
+        ("wMinute", ctypes.c_ushort),
+        ("wSecond", ctypes.c_ushort),
+        ("wMilliseconds", ctypes.c_ushort),
+    ]
+
+
 class WindowsTimeSetter:
     """通过 WinAPI SetSystemTime 写入本机时钟（仅在 Windows 上可用）。"""
 
     def set_system_time(self, unix_ts: float) -> bool:
         try:
-            utc_dt = datetime.fromtimestamp(unix_ts, tz=timezone.utc)
-
-            class SYSTEMTIME(ctypes.Structure):
-                _fields_ = [
-                    ("wYear", ctypes.c_ushort),
-                    ("wMonth", ctypes.c_ushort),
-                    ("wDayOfWeek", ctypes.c_ushort),   # 0 = Sunday
-                    ("wDay", ctypes.c_ushort),
-                    ("wHour", ctypes.c_ushort),
-                    ("wMinute", ctypes.c_ushort),
-                    ("wSecond", ctypes.c_ushort),
-                    ("wMilliseconds", ctypes.c_ushort),
-                ]
+            gm = time.gmtime(unix_ts)
+            ms = int((unix_ts - int(unix_ts)) * 1000)
 
             st = SYSTEMTIME(
-                wYear=utc_dt.year,
-                wMonth=utc_dt.month,
-                wDay=utc_dt.day,
-                wDayOfWeek=(utc_dt.weekday() + 1) % 7,
-                wHour=utc_dt.hour,
-                wMinute=utc_dt.minute,
-                wSecond=utc_dt.second,
-                wMilliseconds=int(utc_dt.microsecond / 1000),
+                wYear=gm.tm_year,
+                wMonth=gm.tm_mon,
+                wDay=gm.tm_mday,
+                wDayOfWeek=(gm.tm_wday + 1) % 7,   # tm_wday: 0 = Monday
+                wHour=gm.tm_hour,
+                wMinute=gm.tm_min,
+                wSecond=gm.tm_sec,
+                wMilliseconds=ms,
             )
-            logging.debug("准备写入系统时间 (Windows UTC): %s", utc_dt.isoformat())
+            utc_str = time.strftime("%Y-%m-%dT%H:%M:%S", gm) + ".%03d+00:00" % ms
+            log.debug("准备写入系统时间 (Windows UTC): %s", utc_str)
             if not ctypes.windll.kernel32.SetSystemTime(ctypes.byref(st)):
                 err = ctypes.GetLastError()
-                logging.error(
+                log.error(
                     "SetSystemTime 调用失败，错误码 %d（请以管理员身份运行）", err
                 )
                 return False
-            logging.info("系统时间已成功同步为 UTC %s", utc_dt.isoformat())
+            log.info("系统时间已成功同步为 UTC %s", utc_str)
             return True
         except Exception:
-            logging.exception("Windows 设置系统时间时发生异常")
+            log.exception("Windows 设置系统时间时发生异常")
             return False
 
 
 # --------------------------------------------------------------
-# Linux 实现（使用 clock_settime + 回退到 date 命令）
+# Linux 实现（使用 clock_settime + 回退到 settimeofday）
 # --------------------------------------------------------------
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+class _Timeval(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_usec", ctypes.c_long)]
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    """加载 libc（Windows 等平台上返回 None）。"""
+    try:
+        return ctypes.CDLL("libc.so.6", use_errno=True)
+    except OSError:
+        pass
+    try:
+        return ctypes.CDLL(None, use_errno=True)
+    except (OSError, TypeError):
+        return None
+
+
+_LIBC = _load_libc()
+if _LIBC is not None and hasattr(_LIBC, "clock_settime"):
+    _LIBC.clock_settime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+    _LIBC.clock_settime.restype = ctypes.c_int
+if _LIBC is not None and hasattr(_LIBC, "settimeofday"):
+    _LIBC.settimeofday.argtypes = [ctypes.POINTER(_Timeval), ctypes.c_void_p]
+    _LIBC.settimeofday.restype = ctypes.c_int
+
+
 class LinuxTimeSetter:
     """在 Linux/Unix 系统上写入系统时间（优先使用 libc.clock_settime）。"""
 
     CLOCK_REALTIME = 0  # clockid_t for CLOCK_REALTIME (POSIX)
 
-    def _set_time_via_libc(self, unix_ts: float) -> bool:
-        """直接调用 libc 的 clock_settime（需要 root）。"""
-        try:
-            class timespec(ctypes.Structure):
-                _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
-
-            ts = timespec()
-            ts.tv_sec = int(unix_ts)
-            ts.tv_nsec = int((unix_ts - ts.tv_sec) * 1_000_000_000)
-
-            libc = ctypes.CDLL("libc.so.6", use_errno=True)
-            res = libc.clock_settime(self.CLOCK_REALTIME, ctypes.byref(ts))
-            if res != 0:
-                errno = ctypes.get_errno()
-                logging.error(
-                    "clock_settime 调用失败，errno=%d (%s)", errno, os.strerror(errno)
-                )
-                return False
-            logging.info(
-                "系统时间已通过 libc.clock_settime 成功同步（UTC %s）",
-                datetime.fromtimestamp(unix_ts, tz=timezone.utc).isoformat(),
-            )
-            return True
-        except Exception:
-            logging.exception("通过 libc 设置系统时间时出现异常")
-            return False
+    def _set_time_via_libc(self, unix_ts: float) -> int:
+        """
+        直接调用 libc 的 clock_settime（需要 root）。
 
-    def _set_time_via_date_cmd(self, unix_ts: float) -> bool:
-        """回退方案：使用 `sudo date -s "YYYY-MM-DD HH:MM:SS"`（需要 sudo）。"""
-        utc_dt = datetime.fromtimestamp(unix_ts, tz=timezone.utc)
-        # 将 UTC 时间转为本地时间字符串，date 命令默认使用本地时区
-        local_str = utc_dt.astimezone().strftime("%Y-%m-%d %H:%M:%S")
-        cmd = ["sudo", "date", "-s", local_str]
-        logging.debug("尝试执行外部命令以设置时间: %s", " ".join(cmd))
-        try:
-            result = subprocess.run(
-                cmd,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
-            logging.info("系统时间已通过 `date` 命令同步（本地时间 %s）", local_str)
-            return True
-        except subprocess.CalledProcessError as e:
-            logging.error(
-                "使用 `date` 命令设置时间失败: %s\nstderr: %s", e, e.stderr.strip()
+        返回 0 表示成功，否则返回失败时的 errno（libc 不可用时为 ENOSYS）。
+        """
+        if _LIBC is None or not hasattr(_LIBC, "clock_settime"):
+            log.error("未能加载 libc.clock_settime，无法写入系统时间")
+            return errno.ENOSYS
+        ts = _Timespec()
+        ts.tv_sec = int(unix_ts)
+        ts.tv_nsec = int((unix_ts - ts.tv_sec) * 1_000_000_000)
+        if _LIBC.clock_settime(self.CLOCK_REALTIME, ctypes.byref(ts)) != 0:
+            err = ctypes.get_errno()
+            log.error(
+                "clock_settime 调用失败，errno=%d (%s)", err, os.strerror(err)
             )
+            return err
+        log.info(
+            "系统时间已通过 libc.clock_settime 成功同步（UTC %s）",
+            datetime.fromtimestamp(unix_ts, tz=timezone.utc).isoformat(),
+        )
+        return 0
+
+    def _set_time_via_settimeofday(self, unix_ts: float) -> bool:
+        """回退方案：调用 libc 的 settimeofday（兼容不支持 clock_settime 的旧系统）。"""
+        if _LIBC is None or not hasattr(_LIBC, "settimeofday"):
             return False
-        except FileNotFoundError:
-            logging.error("`date` 命令未找到，无法在此平台上设置系统时间")
+        tv = _Timeval()
+        tv.tv_sec = int(unix_ts)
+        tv.tv_usec = int((unix_ts - tv.tv_sec) * 1_000_000)
+        if _LIBC.settimeofday(ctypes.byref(tv), None) != 0:
+            err = ctypes.get_errno()
+            log.error(
+                "settimeofday 调用失败，errno=%d (%s)", err, os.strerror(err)
+            )
             return False
+        log.info(
+            "系统时间已通过 libc.settimeofday 成功同步（UTC %s）",
+            datetime.fromtimestamp(unix_ts, tz=timezone.utc).isoformat(),
+        )
+        return True
 
     def set_system_time(self, unix_ts: float) -> bool:
-        """统一入口：先尝试 libc，若失败回退到 date 命令。"""
-        if self._set_time_via_libc(unix_ts):
+        """统一入口：先尝试 clock_settime，若失败回退到 settimeofday。"""
+        err = self._set_time_via_libc(unix_ts)
+        if err == 0:
             return True
-        return self._set_time_via_date_cmd(unix_ts)
+        if err == errno.EPERM:
+            # 缺少 root / CAP_SYS_TIME 时 settimeofday 同样会失败，无需再试
+            log.error("权限不足：写入系统时间需要 root 权限或 CAP_SYS_TIME 能力")
+            return False
+        return self._set_time_via_settimeofday(unix_ts)
 
 
 # --------------------------------------------------------------
 # 根据运行平台返回合适的 TimeSetter 实例
 # --------------------------------------------------------------
+@functools.lru_cache(maxsize=1)
 def get_time_setter() -> Optional[TimeSetter]:
     """返回当前平台对应的 TimeSetter（None 表示平台不支持写入系统时间）"""
-    current = platform.system().lower()
-    if current == "windows":
+    if _PLATFORM == "windows":
         return WindowsTimeSetter()
-    elif current in ("linux", "darwin", "freebsd", "openbsd", "netbsd"):
+    elif _PLATFORM in ("linux", "darwin", "freebsd", "openbsd", "netbsd"):
         return LinuxTimeSetter()
     else:
-        logging.warning("未检测到对当前平台 (%s) 的系统时间写入实现", current)
+        log.warning("未检测到对当前平台 (%s) 的系统时间写入实现", _PLATFORM)
         return None
 
 
 # --------------------------------------------------------------
-# NTP 客户端（查询部分保持不变，只是打印时改为本地时间）
+# Linux 批量发送（sendmmsg：一次系统调用发出所有请求）
+# --------------------------------------------------------------
+class _Iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _Msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_Iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _Mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _Msghdr), ("msg_len", ctypes.c_uint)]
+
+
+_sendmmsg = None
+if _PLATFORM == "linux" and hasattr(_LIBC, "sendmmsg"):
+    _sendmmsg = _LIBC.sendmmsg
+    _sendmmsg.argtypes = [
+        ctypes.c_int, ctypes.POINTER(_Mmsghdr), ctypes.c_uint, ctypes.c_int
+    ]
+    _sendmmsg.restype = ctypes.c_int
+
+
+def _pack_sockaddr(family: int, sockaddr: Tuple[Any, ...]) -> bytes:
+    """将 Python 的地址元组编码为 struct sockaddr_in / sockaddr_in6。"""
+    if family == socket.AF_INET:
+        host, port = sockaddr
+        return struct.pack("=H", family) + struct.pack(
+            "!H4s8x", port, socket.inet_pton(socket.AF_INET, host)
+        )
+    if family == socket.AF_INET6:
+        host, port, flowinfo, scope_id = sockaddr
+        return (
+            struct.pack("=H", family)
+            + struct.pack(
+                "!HI16s", port, flowinfo,
+                socket.inet_pton(socket.AF_INET6, host.partition("%")[0]),
+            )
+            + struct.pack("=I", scope_id)
+        )
+    raise ValueError("不支持的地址族 %d" % family)
+
+
+def _sendmmsg_batch(
+    sock: socket.socket, packet: bytes, addrs: List[Tuple[Any, ...]]
+) -> int:
+    """
+    通过 sendmmsg 将同一报文发往多个地址，返回成功发送的条数。
+
+    非 Linux 平台或调用失败时返回 0，由调用方回退到逐个 ``sendto``。
+    """
+    if _sendmmsg is None or not addrs:
+        return 0
+    try:
+        names = [_pack_sockaddr(sock.family, addr) for addr in addrs]
+    except (OSError, ValueError):
+        return 0
+
+    # 所有消息共用同一个 iovec，指向同一份请求报文
+    payload = ctypes.c_char_p(packet)
+    iov = _Iovec(ctypes.cast(payload, ctypes.c_void_p), len(packet))
+    name_bufs = [ctypes.create_string_buffer(name, len(name)) for name in names]
+    msgs = (_Mmsghdr * len(addrs))()
+    for msg, buf in zip(msgs, name_bufs):
+        msg.msg_hdr.msg_name = ctypes.cast(buf, ctypes.c_void_p)
+        msg.msg_hdr.msg_namelen = len(buf)
+        msg.msg_hdr.msg_iov = ctypes.pointer(iov)
+        msg.msg_hdr.msg_iovlen = 1
+
+    sent = _sendmmsg(sock.fileno(), msgs, len(addrs), 0)
+    if sent < 0:
+        err = ctypes.get_errno()
+        log.debug("sendmmsg 调用失败，errno=%d (%s)", err, os.strerror(err))
+        return 0
+    return sent
+
+
+# --------------------------------------------------------------
+# NTP 客户端（并发查询多个服务器，打印时使用本地时间）
 # --------------------------------------------------------------
 class NTPClient:
     """简洁的 UDP NTP 客户端"""
@@ -214,62 +362,240 @@ class NTPClient:
     def __init__(self, cfg: Optional[NTPConfig] = None):
         self.cfg = cfg or NTPConfig()
         self.port = 123
+        # 请求报文前 40 字节固定不变（LI=0, Mode=3，其余字段全 0），构造一次后复用；
+        # 末 8 字节的 Transmit Timestamp 每次查询填入随机 nonce
+        self._header = bytes([((self.cfg.version & 7) << 3) | 3]) + bytes(39)
+        self._nonce = bytes(8)
+        # server -> (address family, sockaddr, 过期时间 monotonic)
+        self._dns_cache: Dict[str, Tuple[int, Tuple[Any, ...], float]] = {}
+        # server -> 冷却结束时间 monotonic（返回 KoD / 未同步响应的服务器）
+        self._bad_servers: Dict[str, float] = {}
+        # 复用的接收缓冲区：只解析前 48 字节，但需容纳带 MAC / 扩展字段的响应，
+        # 否则 Windows 上 recvfrom_into 会因 WSAEMSGSIZE 报错而丢弃整个响应
+        self._rx_buf = bytearray(_RX_BUF_SIZE)
+        self._rx_view = memoryview(self._rx_buf)
+        # 每个地址族一个非阻塞 UDP socket，延迟创建并在多次查询间复用
+        self._socks: Dict[int, socket.socket] = {}
+        self._sel = selectors.DefaultSelector()
+
+    def close(self) -> None:
+        """关闭复用的 socket（客户端不再使用时调用）。"""
+        for sock in self._socks.values():
+            self._sel.unregister(sock)
+            sock.close()
+        self._socks.clear()
+        self._sel.close()
 
     # ----------------------------------------------------------
     # 1. 组装 NTP 请求报文（48 字节）
     # ----------------------------------------------------------
     def _build_packet(self) -> bytes:
-        li = 0
-        vn = self.cfg.version
-        mode = 3
-        first_byte = (li << 6) | (vn << 3) | mode
-        packet = struct.pack("!B B B B 11I", first_byte, 0, 0, 0, *([0] * 11))
-        return packet
+        """
+        生成本次查询的请求报文。
+
+        服务器会把 Transmit Timestamp 原样写回响应的 Originate Timestamp，
+        据此可丢弃上一次查询遗留的迟到响应（RFC 5905 §8）。
+        """
+        self._nonce = os.urandom(8)
+        return self._header + self._nonce
 
     # ----------------------------------------------------------
-    # 2. 发送请求并解析响应
+    # 2. 解析服务器地址（带 TTL 缓存，避免每次发送都查询 DNS）
     # ----------------------------------------------------------
-    def get_ntp_time(self, server: str) -> Optional[float]:
-        logging.debug("向 %s 发送 NTP 请求", server)
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                sock.settimeout(self.cfg.timeout)
-                sock.sendto(self._build_packet(), (server, self.port))
-                data, _ = sock.recvfrom(512)
-        except (socket.timeout, socket.gaierror) as exc:
-            logging.warning("网络错误（%s）: %s", server, exc)
-            return None
-        except OSError as exc:
-            logging.error("Socket 错误: %s", exc)
-            return None
+    def _resolve(self, server: str) -> Tuple[int, Tuple[Any, ...]]:
+        now = time.monotonic()
+        cached = self._dns_cache.get(server)
+        if cached is not None and cached[2] > now:
+            return cached[0], cached[1]
+
+        family, _, _, _, sockaddr = socket.getaddrinfo(
+            server, self.port, type=socket.SOCK_DGRAM
+        )[0]
+        self._dns_cache[server] = (family, sockaddr, now + DNS_CACHE_TTL)
+        return family, sockaddr
+
+    def _get_socket(self, family: int) -> socket.socket:
+        """返回该地址族的复用 socket，并丢弃上次查询遗留的迟到响应。"""
+        sock = self._socks.get(family)
+        if sock is None:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            self._socks[family] = sock
+            self._sel.register(sock, selectors.EVENT_READ)
+            return sock
+        while True:
+            try:
+                sock.recvfrom_into(self._rx_buf)
+            except BlockingIOError:   # 缓冲区已清空
+                return sock
+            except OSError:
+                # 如 Windows 上 ICMP 端口不可达导致的 ConnectionResetError，继续清空
+                continue
+
+    def _send_all(
+        self,
+        sock: socket.socket,
+        packet: bytes,
+        targets: List[Tuple[str, Tuple[Any, ...]]],
+    ) -> List[Tuple[str, Tuple[Any, ...]]]:
+        """向同一地址族的所有目标发送请求，返回发送成功的 (server, sockaddr)。"""
+        sent = _sendmmsg_batch(sock, packet, [addr for _, addr in targets])
+        done = targets[:sent]
+        for srv, sockaddr in targets[sent:]:
+            try:
+                sock.sendto(packet, sockaddr)
+            except OSError as exc:
+                # 缓存的地址可能已失效：剔除后下次查询重新解析
+                self._dns_cache.pop(srv, None)
+                log.error("Socket 错误（%s）: %s", srv, exc)
+                continue
+            done.append((srv, sockaddr))
+        return done
 
-        if len(data) < 48:
-            logging.warning("收到的 NTP 包长度不足 (%d < 48)", len(data))
+    # ----------------------------------------------------------
+    # 3. 解析响应报文
+    # ----------------------------------------------------------
+    def _parse_response(
+        self, data: memoryview, nbytes: int, server: str, t1: float, t4: float
+    ) -> Optional[Tuple[float, float]]:
+        """
+        按 RFC 5905 计算本机时钟偏差与往返时延，返回 ``(offset, delay)``。
+
+        t1 / t4 为本机发送 / 接收时刻，t2 / t3 为服务器接收 / 发送时刻。
+        """
+        if nbytes < 48:
+            log.warning("收到的 NTP 包长度不足 (%d < 48, %s)", nbytes, server)
             return None
 
-        try:
-            seconds, fraction = struct.unpack("!II", data[40:48])
-        except struct.error as exc:
-            logging.error("解析时间戳失败: %s", exc)
+        # LI=3 表示服务器时钟未同步，stratum=0 为 Kiss-o'-Death 包（RFC 5905）
+        leap, stratum = data[0] >> 6, data[1]
+        if leap == 3 or stratum == 0:
+            log.warning(
+                "%s 返回无效响应（LI=%d, stratum=%d），%.0f 秒内不再使用",
+                server, leap, stratum, BAD_SERVER_COOLDOWN,
+            )
+            self._bad_servers[server] = time.monotonic() + BAD_SERVER_COOLDOWN
             return None
 
-        ntp_timestamp = seconds + fraction / 2**32
-        unix_timestamp = ntp_timestamp - NTP_DELTA
-        return unix_timestamp
+        # 长度已校验，unpack_from 不会越界
+        t2_sec, t2_frac = _TS_UNPACK(data, 32)
+        t3_sec, t3_frac = _TS_UNPACK(data, 40)
+        t2 = t2_sec - NTP_DELTA + t2_frac * _FRAC_SCALE
+        t3 = t3_sec - NTP_DELTA + t3_frac * _FRAC_SCALE
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        delay = (t4 - t1) - (t3 - t2)
+        return offset, delay
 
     # ----------------------------------------------------------
-    # 3. 轮询服务器列表（带回退）
+    # 4. 并发查询：向所有候选服务器同时发送请求，取最先到达的有效响应
     # ----------------------------------------------------------
-    def query(self, server: Optional[str] = None) -> Optional[float]:
-        candidates = [server] if server else self.cfg.servers
+    def _query_parallel(
+        self, candidates: List[str]
+    ) -> Optional[Tuple[float, float]]:
+        # 按地址族分组：每个地址族只用一个 socket，便于批量发送
+        groups: Dict[int, List[Tuple[str, Tuple[Any, ...]]]] = {}
+        # 响应按来源地址匹配，解析到同一地址的候选只发送一次
+        seen: Dict[Tuple[Any, ...], str] = {}
         for srv in candidates:
-            ts = self.get_ntp_time(srv)
-            if ts is not None:
-                return ts
+            try:
+                family, sockaddr = self._resolve(srv)
+            except socket.gaierror as exc:
+                log.warning("网络错误（%s）: %s", srv, exc)
+                continue
+            first = seen.get(sockaddr[:2])
+            if first is not None:
+                log.debug(
+                    "%s 与 %s 解析到同一地址 %s，跳过重复请求", srv, first, sockaddr[0]
+                )
+                continue
+            seen[sockaddr[:2]] = srv
+            groups.setdefault(family, []).append((srv, sockaddr))
+
+        # (host, port) -> (server, 发送时刻 t1)
+        pending: Dict[Tuple[Any, ...], Tuple[str, float]] = {}
+        packet = self._build_packet()
+        for family, targets in groups.items():
+            try:
+                sock = self._get_socket(family)
+            except OSError as exc:
+                log.error("Socket 错误: %s", exc)
+                continue
+            t1 = time.time()
+            for srv, sockaddr in self._send_all(sock, packet, targets):
+                log.debug("向 %s 发送 NTP 请求", srv)
+                pending[sockaddr[:2]] = (srv, t1)
+
+        deadline = time.monotonic() + self.cfg.timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in self._sel.select(remaining):
+                try:
+                    nbytes, addr = key.fileobj.recvfrom_into(self._rx_buf)
+                except BlockingIOError:
+                    continue
+                except OSError as exc:
+                    log.error("Socket 错误: %s", exc)
+                    continue
+                t4 = time.time()
+                if nbytes >= 32 and self._rx_view[24:32] != self._nonce:
+                    log.debug(
+                        "忽略来自 %s 的过期响应（Originate 时间戳不匹配）", addr[0]
+                    )
+                    continue
+                entry = pending.pop(addr[:2], None)
+                if entry is None:
+                    log.debug("忽略来自 %s 的非预期响应", addr[0])
+                    continue
+                srv, t1 = entry
+                result = self._parse_response(self._rx_view, nbytes, srv, t1, t4)
+                if result is not None:
+                    log.debug("采用 %s 的响应", srv)
+                    return result
+
+        for srv, _ in pending.values():
+            log.warning("网络错误（%s）: 超时", srv)
         return None
 
+    def get_ntp_time(self, server: str) -> Optional[Tuple[float, float]]:
+        """查询单个服务器，返回 ``(offset, delay)``（失败返回 None）。"""
+        return self._query_parallel([server])
+
     # ----------------------------------------------------------
-    # 4. 同步（查询 +（可选）写入系统时间）
+    # 5. 查询服务器列表（所有候选并发发送，失败后按指数退避重试）
+    # ----------------------------------------------------------
+    def _healthy(self, candidates: List[str]) -> List[str]:
+        """剔除冷却期内的服务器；若全部处于冷却期，则仍使用完整列表。"""
+        now = time.monotonic()
+        healthy = [
+            srv for srv in candidates if self._bad_servers.get(srv, 0.0) <= now
+        ]
+        return healthy or candidates
+
+    def query(
+        self, server: Optional[str] = None
+    ) -> Optional[Tuple[float, float]]:
+        candidates = [server] if server else list(self.cfg.servers)
+        for attempt in range(self.cfg.retries + 1):
+            # 每轮打乱顺序，避免反复失败时总是先请求同一个地址
+            random.shuffle(candidates)
+            result = self._query_parallel(self._healthy(candidates))
+            if result is not None:
+                return result
+            if attempt < self.cfg.retries:
+                delay = min(
+                    self.cfg.backoff_base * (1 << attempt), self.cfg.backoff_cap
+                )
+                log.warning(
+                    "所有服务器均未响应，%.1f 秒后重试（%d/%d）",
+                    delay, attempt + 1, self.cfg.retries,
+                )
+                time.sleep(delay)
+        return None
+
+    # ----------------------------------------------------------
+    # 6. 同步（查询 +（可选）写入系统时间）
     # ----------------------------------------------------------
     def sync(
         self,
@@ -279,51 +605,61 @@ class NTPClient:
     ) -> bool:
         """
         主流程：
-        1. 查询 NTP 时间；
-        2. 与本机时间比较，输出差值；
+        1. 查询 NTP 服务器，按 RFC 5905 计算本机时钟偏差（已扣除网络往返时延）；
+        2. 输出服务器时间、本机时间与差值；
         3. 若 ``set_system`` 为 True 且差值 > 阈值，则尝试写入系统时间。
         """
-        logging.info("查询 NTP 时间...")
-        ntp_ts = self.query(server)
-        if ntp_ts is None:
-            logging.error("无法从任何 NTP 服务器获取时间")
+        log.info("查询 NTP 时间...")
+        result = self.query(server)
+        if result is None:
+            log.error("无法从任何 NTP 服务器获取时间")
             return False
 
+        offset, delay = result
         local_ts = time.time()
-        diff = abs(ntp_ts - local_ts)
+        ntp_ts = local_ts + offset
+        diff = abs(offset)
 
         # ---------- 本地时间显示 ----------
-        # 将 UTC 时间转换为本地时区后打印
-        local_tz = datetime.now().astimezone().tzinfo   # 当前系统时区
-        ntp_local = datetime.fromtimestamp(ntp_ts, tz=local_tz)
-        local_now = datetime.fromtimestamp(local_ts, tz=local_tz)
-
-        logging.info("NTP 服务器时间（本地时区） : %s", ntp_local.strftime("%Y-%m-%d %H:%M:%S %Z"))
-        logging.info("本机时间（本地时区）      : %s", local_now.strftime("%Y-%m-%d %H:%M:%S %Z"))
-        logging.info("时间差                     : %.3f 秒", diff)
+        log.info("NTP 服务器时间（本地时区） : %s", _format_local(ntp_ts))
+        log.info("本机时间（本地时区）      : %s", _format_local(local_ts))
+        log.info("时间差                     : %.3f 秒", diff)
+        log.debug("往返时延                   : %.3f 秒", delay)
 
         if set_system:
             # 只有当差值超过阈值才写入系统时间
             if diff <= self.cfg.sync_threshold:
-                logging.info(
+                log.info(
                     "时间差小于 %.1f 秒，无需同步系统时间", self.cfg.sync_threshold
                 )
                 return True
 
             if time_setter is None:
-                logging.error("当前平台不支持写入系统时间")
+                log.error("当前平台不支持写入系统时间")
                 return False
 
-            logging.info("尝试同步系统时间（需要管理员/ROOT 权限）...")
-            return time_setter.set_system_time(ntp_ts)
+            log.info("尝试同步系统时间（需要管理员/ROOT 权限）...")
+            # 以写入时刻的本机时间加上偏差，避免日志输出耗时引入误差
+            return time_setter.set_system_time(time.time() + offset)
 
-        logging.info("仅查询时间，未执行系统时间写入")
+        log.info("仅查询时间，未执行系统时间写入")
         return True
 
 
 # --------------------------------------------------------------
 # 参数解析
 # --------------------------------------------------------------
+def _non_negative_int(value: str) -> int:
+    """argparse 类型：非负整数"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("无效的整数: %r" % value)
+    if number < 0:
+        raise argparse.ArgumentTypeError("不能为负数: %d" % number)
+    return number
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="跨平台 NTP 时间同步工具（本地时间显示版）"
@@ -358,6 +694,13 @@ def parse_args() -> argparse.Namespace:
         default=SYNC_THRESHOLD,
         help="同步阈值（秒），仅在时间差大于该值时才写系统时间",
     )
+    parser.add_argument(
+        "--retries",
+        type=_non_negative_int,
+        default=0,
+        help="所有服务器均失败后的重试次数（间隔 %.0f 秒起指数退避，上限 %.0f 秒），默认 0"
+        % (BACKOFF_BASE, BACKOFF_CAP),
+    )
     return parser.parse_args()
 
 
@@ -371,6 +714,7 @@ def main() -> None:
     cfg = NTPConfig(
         timeout=args.timeout,
         sync_threshold=args.threshold,
+        retries=args.retries,
     )
     client = NTPClient(cfg)
 
@@ -383,11 +727,13 @@ def main() -> None:
             time_setter=time_setter,
         )
     except KeyboardInterrupt:
-        logging.warning("用户中断")
+        log.warning("用户中断")
         sys.exit(130)   # 130 = 128 + SIGINT
     except Exception:
-        logging.exception("同步过程中出现未捕获异常")
+        log.exception("同步过程中出现未捕获异常")
         sys.exit(1)
+    finally:
+        client.close()
 
     sys.exit(0 if ok else 1)
 